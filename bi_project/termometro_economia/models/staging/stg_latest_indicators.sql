@@ -0,0 +1,64 @@
+-- models/staging/stg_latest_indicators.sql
+-- Último registro de cada indicador, usado nas métricas do dashboard.
+-- Materialized view: o `dbt run` diário do workflow a atualiza depois da carga dos dados.
+-- Cada "order by data_referencia desc limit 1" usa o índice da chave primária (data) da tabela de origem.
+
+{{ config(
+    materialized='materialized_view',
+    indexes=[{'columns': ['indicador'], 'unique': True}]
+) }}
+
+with selic as (
+
+    select 'selic' as indicador, data_referencia, taxa_selic_percentual as valor
+    from {{ ref('stg_selic') }}
+    order by data_referencia desc
+    limit 1
+
+),
+
+ipca as (
+
+    select 'ipca' as indicador, data_referencia, indice_ipca as valor
+    from {{ ref('stg_ipca') }}
+    order by data_referencia desc
+    limit 1
+
+),
+
+cambio as (
+
+    select 'cambio' as indicador, data_referencia, cambio_ptax_venda_brl_usd as valor
+    from {{ ref('stg_cambio_ptax_venda') }}
+    order by data_referencia desc
+    limit 1
+
+),
+
+desemprego as (
+
+    select 'desemprego' as indicador, data_referencia, taxa_desemprego_percentual as valor
+    from {{ ref('stg_desemprego') }}
+    order by data_referencia desc
+    limit 1
+
+),
+
+pib as (
+
+    select 'pib' as indicador, data_referencia, pib_valor_corrente_brl_milhoes as valor
+    from {{ ref('stg_pib_trimestral') }}
+    order by data_referencia desc
+    limit 1
+
+)
+
+select * from selic
+union all
+select * from ipca
+union all
+select * from cambio
+union all
+select * from desemprego
+union all
+select * from pib
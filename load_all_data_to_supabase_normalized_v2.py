@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import psycopg2
+from psycopg2.extras import execute_values
 import json
 import os
 from datetime import datetime
@@ -27,7 +28,8 @@ FILES_TO_LOAD = {
 }
 
 # --- Batch Size ---
-BATCH_SIZE = 100
+# Cada lote vira um único INSERT multi-linha via execute_values (executemany faria um round-trip por linha)
+BATCH_SIZE = 10000
 
 # --- Helper Functions ---
 def get_db_connection():
@@ -86,7 +88,7 @@ def load_data_batch(conn, table_name, data):
         print(f"Nenhum dado para carregar na tabela {table_name}.")
         return
 
-    insert_sql = f"INSERT INTO {table_name} (data, valor) VALUES (%s, %s) ON CONFLICT (data) DO UPDATE SET valor = EXCLUDED.valor;"
+    insert_sql = f"INSERT INTO {table_name} (data, valor) VALUES %s ON CONFLICT (data) DO UPDATE SET valor = EXCLUDED.valor;"
     total_inserted = 0
     records_skipped = 0
     batch_values = []
@@ -110,6 +112,10 @@ def load_data_batch(conn, table_name, data):
                 records_skipped += 1
         else:
             records_skipped += 1
+
+    # Um mesmo INSERT ... ON CONFLICT DO UPDATE não pode atualizar a mesma data duas vezes;
+    # mantém o último valor de cada data, como acontecia ao inserir linha a linha
+    batch_values = list(dict(batch_values).items())
             
     if not batch_values:
         print(f"Nenhum registro válido encontrado após normalização para {table_name}. Registros pulados: {records_skipped}")
@@ -123,7 +129,7 @@ def load_data_batch(conn, table_name, data):
             for i in range(0, len(batch_values), BATCH_SIZE):
                 batch = batch_values[i:i + BATCH_SIZE]
                 start_time = datetime.now()
-                cur.executemany(insert_sql, batch)
+                execute_values(cur, insert_sql, batch, page_size=BATCH_SIZE)
                 conn.commit()
                 end_time = datetime.now()
                 total_inserted += len(batch)
@@ -1,26 +1,33 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 import pandas as pd
-import psycopg2
-import plotly.express as px
+from psycopg2 import pool
+import numpy as np
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import pytz # Adicionado para fuso horário
+from pathlib import Path
+from zoneinfo import ZoneInfo # Adicionado para fuso horário
 import math
-from prophet import Prophet
-from prophet.plot import plot_plotly, plot_components_plotly
-import base64
+import hashlib
+import io
 import os # Adicionado para os.environ
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+BRASILIA_TZ = ZoneInfo("America/Sao_Paulo")
 
 def get_current_brasilia_time():
     """Retorna a data e hora atual no fuso horário de Brasília."""
-    brasilia_tz = pytz.timezone("America/Sao_Paulo")
-    now_brasilia = datetime.now(brasilia_tz)
-    return now_brasilia.strftime("%d/%m/%Y %H:%M:%S")
+    return datetime.now(BRASILIA_TZ).strftime("%d/%m/%Y %H:%M:%S")
 
-def decode_base64(encoded_string):
-    """Decodes a Base64 encoded string."""
-    return base64.b64decode(encoded_string).decode("utf-8")
+@st.cache_resource # Lê cada imagem do disco uma única vez por processo
+def load_asset(path):
+    """Retorna o conteúdo (bytes) de um arquivo de assets/."""
+    return Path(path).read_bytes()
 
 # --- Database Credentials (Lidas de st.secrets para produção) ---
 DB_HOST = st.secrets.get("DB_HOST", os.environ.get("DB_HOST"))
@@ -30,82 +37,263 @@ DB_USER = st.secrets.get("DB_USER", os.environ.get("DB_USER"))
 DB_PASSWORD = st.secrets.get("DB_PASSWORD", os.environ.get("DB_PASSWORD"))
 
 # --- Database Connection --- 
-@st.cache_resource # Cache the connection for efficiency
-def get_db_connection():
-    """Estabelece uma conexão com o banco de dados PostgreSQL."""
+DB_FETCH_WORKERS = 5 # Threads por chamada de fetch_all (uma por indicador)
+DB_POOL_MAX_CONNECTIONS = 10 # Comporta as buscas paralelas de mais de uma sessão
+
+@st.cache_resource(show_spinner=False) # Cache the connection pool for efficiency (criado dentro das threads de fetch_all)
+def get_db_pool():
+    """Cria um pool de conexões com o banco de dados PostgreSQL, seguro para uso entre threads.
+
+    Levanta exceção em caso de falha, para que um erro transitório não fique guardado no cache.
+    """
     if not all([DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD]):
-        st.error("As credenciais do banco de dados não foram configuradas corretamente como secrets. Verifique as configurações de implantação.")
-        return None
-    try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            connect_timeout=10
-        )
-        return conn
-    except psycopg2.OperationalError as e:
-        st.error(f"Erro ao conectar ao banco de dados: {e}")
-        print(f"Erro ao conectar ao banco de dados: {e}")
-        return None
-
-@st.cache_data(ttl=3600) # Cache data for 1 hour
-def fetch_data(query):
-    """Busca dados do banco de dados usando a query fornecida."""
-    conn = get_db_connection()
-    if conn:
+        raise RuntimeError("As credenciais do banco de dados não foram configuradas corretamente como secrets. Verifique as configurações de implantação.")
+    # minconn cobre as threads de uma busca completa: o pool fecha conexões devolvidas além de minconn,
+    # e com um valor menor cada fetch_all frio reabriria conexões (TLS) com o banco
+    return pool.ThreadedConnectionPool(
+        DB_FETCH_WORKERS,
+        DB_POOL_MAX_CONNECTIONS,
+        host=DB_HOST,
+        port=DB_PORT,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        connect_timeout=10
+    )
+
+@st.cache_resource(show_spinner=False) # Compartilhado entre sessões, como o pool
+def get_db_pool_slots():
+    """Semáforo com uma vaga por conexão do pool: quem chega com o pool cheio espera em vez de receber PoolError."""
+    return threading.BoundedSemaphore(DB_POOL_MAX_CONNECTIONS)
+
+# Tipos das colunas no CSV gerado pelo COPY: datas chegam como texto ISO, o nome do indicador como texto
+# e todas as demais colunas são numéricas. Declará-los evita a passada de inferência de tipos do pandas;
+# float32 basta para a precisão dos indicadores e reduz à metade a memória das séries.
+CSV_DTYPES = defaultdict(lambda: "float32", data_referencia="object", indicador="object")
+
+def read_query(query, params=None):
+    """Lê do banco de dados o resultado da query (e dos parâmetros, se houver) fornecida.
+
+    O resultado é exportado pelo próprio servidor com COPY ... TO STDOUT e lido
+    pelo parser em C do pandas, sem montar uma tupla Python por linha.
+    """
+    db_pool = get_db_pool()
+    with get_db_pool_slots():
+        conn = db_pool.getconn()
         try:
-            df = pd.read_sql_query(query, conn)
+            buffer = io.BytesIO()
+            with conn.cursor() as cur:
+                if params is not None:
+                    query = cur.mogrify(query, params).decode() # COPY não aceita parâmetros, então eles são interpolados pelo driver
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT CSV, HEADER)", buffer)
+            buffer.seek(0)
+            df = pd.read_csv(buffer, dtype=CSV_DTYPES)
             if "data_referencia" in df.columns:
-                 df["data_referencia"] = pd.to_datetime(df["data_referencia"])
-                 df["ano"] = df["data_referencia"].dt.year
+                df["data_referencia"] = pd.to_datetime(df["data_referencia"], format="%Y-%m-%d").astype("datetime64[s]")
+                df["ano"] = df["data_referencia"].dt.year.astype("int16")
             return df
-        except Exception as e:
-            st.error(f"Erro ao buscar dados: {e}")
-            print(f"Erro ao buscar dados: {e}")
-            return pd.DataFrame()
-    else:
+        finally:
+            db_pool.putconn(conn)
+
+@st.cache_data(ttl=3600, show_spinner=False) # Cache data for 1 hour; sem spinner, pois roda nas threads de fetch_all
+def fetch_data(query, params=None):
+    """Busca dados do banco de dados usando a query (e os parâmetros, se houver) fornecida."""
+    return read_query(query, params)
+
+QUERY_LATEST_INDICATORS = "SELECT indicador, data_referencia, valor FROM public.stg_latest_indicators"
+
+@st.cache_data(ttl=300) # Cache de 5 minutos: são só 5 linhas e refletem logo a carga diária
+def fetch_latest_indicators():
+    """Busca o último registro de cada indicador na materialized view stg_latest_indicators."""
+    return read_query(QUERY_LATEST_INDICATORS)
+
+def report_fetch_error(e):
+    """Exibe (na thread do script) um erro de busca de dados."""
+    st.error(f"Erro ao buscar dados: {e}")
+    print(f"Erro ao buscar dados: {e}")
+
+def fetch_or_report(fetch_func, *args):
+    """Chama uma busca cacheada; se ela falhar, exibe o erro e devolve um DataFrame vazio, que não vai para o cache."""
+    try:
+        return fetch_func(*args)
+    except Exception as e:
+        report_fetch_error(e)
         return pd.DataFrame()
 
+def fetch_all(queries, params=None):
+    """Executa as queries em paralelo, cada uma com sua conexão do pool, e retorna {nome: DataFrame}.
+
+    Os erros são capturados nas threads e exibidos depois, na thread do script; a query que falhou
+    volta como DataFrame vazio, sem entrar no cache.
+    """
+    ctx = get_script_run_ctx()
+
+    def run(query):
+        add_script_run_ctx(ctx=ctx) # Dá às threads acesso ao cache da sessão
+        try:
+            return fetch_data(query, params), None
+        except Exception as e:
+            return pd.DataFrame(), e
+
+    with ThreadPoolExecutor(max_workers=min(len(queries), DB_FETCH_WORKERS)) as executor:
+        results = dict(zip(queries, executor.map(run, queries.values())))
+
+    reported = set()
+    for df, error in results.values():
+        if error is not None and str(error) not in reported: # Banco fora do ar: uma mensagem, não cinco
+            reported.add(str(error))
+            report_fetch_error(error)
+    return {name: df for name, (df, error) in results.items()}
+
 # --- Helper Functions for Period Grouping --- 
 def get_period_groups(years, group_size):
     if not years or group_size < 1:
         return []
     min_year = min(years)
     max_year = max(years)
-    groups = []
-    current_year = max_year
-    while current_year >= min_year:
-        start_year = max(min_year, current_year - (group_size - 1))
-        group_label = f"{start_year}-{current_year}"
-        groups.append((group_label, list(range(start_year, current_year + 1))))
-        current_year -= group_size
-    return groups
+    # Fins de cada grupo, do mais recente ao mais antigo; o grupo mais antigo é truncado em min_year
+    end_years = np.arange(max_year, min_year - 1, -group_size)
+    start_years = np.maximum(end_years - (group_size - 1), min_year)
+    return [
+        (f"{start_year}-{end_year}", list(range(start_year, end_year + 1)))
+        for start_year, end_year in zip(start_years.tolist(), end_years.tolist())
+    ]
+
+# --- Downsampling de séries longas (Selic e câmbio são diárias) --- 
+RESAMPLE_THRESHOLD = 1000 # Acima disso, a série é agregada por média semanal antes do Prophet e dos gráficos
+MARKERS_THRESHOLD = 500 # Acima disso, os gráficos mostram só a linha, sem marcadores
+
+def resample_weekly(df, date_col, value_col):
+    """Agrega a série por média semanal, descartando semanas sem dados.
+
+    Cada semana é datada pela última observação real que contém (e não pelo domingo que a fecha),
+    para que nenhum ponto fique com data posterior aos dados.
+    """
+    weeks = df.groupby(df[date_col].dt.to_period("W"))
+    return pd.DataFrame({date_col: weeks[date_col].max(), value_col: weeks[value_col].mean()}).dropna().reset_index(drop=True)
+
+# --- Correlation Helpers --- 
+def build_correlation_data(indicator_frames):
+    """Alinha os indicadores por data em um único DataFrame e calcula a matriz de correlação de uma vez.
+
+    O concat é externo: corr() usa, para cada par, apenas as datas em comum aos dois indicadores.
+    """
+    series = {name: df.set_index("data_referencia")[name] for name, df in indicator_frames.items() if not df.empty}
+    if not series:
+        return pd.DataFrame(), pd.DataFrame()
+    df_all = pd.concat(series, axis=1)
+    return df_all, df_all.corr(min_periods=2)
+
+# --- Forecast Helpers --- 
+PROPHET_CACHE_DIR = Path(".prophet_cache") # Modelos treinados, para sobreviver a reinícios do app
+PROPHET_CACHE_MAX_MODELS = 5 # Um modelo por indicador (as chaves de QUERIES), em memória e em disco
+PROPHET_STALE_TMP_SECONDS = 3600 # Temporários mais velhos que isso são sobras de gravações interrompidas
+# O dashboard só exibe yhat e o intervalo de 80%: 200 amostras bastam para esse intervalo (padrão do Prophet: 1000)
+PROPHET_PARAMS = {"uncertainty_samples": 200, "interval_width": 0.8}
+
+@st.cache_resource(show_spinner=False) # Importa o Prophet (cmdstanpy/Stan) só quando uma previsão é pedida
+def load_prophet():
+    """Importa sob demanda o pacote prophet, com seus módulos de gráficos e de serialização."""
+    import prophet
+    import prophet.plot
+    import prophet.serialize
+    return prophet
+
+def hash_training_data(df_prophet):
+    """Gera um hash estável dos dados de treino (e dos parâmetros do Prophet) para identificar o modelo treinado com eles."""
+    hasher = hashlib.blake2b(pd.util.hash_pandas_object(df_prophet).values.tobytes(), digest_size=16)
+    hasher.update(repr(sorted(PROPHET_PARAMS.items())).encode())
+    return hasher.hexdigest()
+
+@st.cache_resource(max_entries=PROPHET_CACHE_MAX_MODELS, show_spinner=False) # Reaproveita o modelo treinado enquanto os dados não mudarem
+def load_or_fit_prophet(indicator, data_hash, _df_prophet):
+    """Carrega do disco o modelo já treinado com esses dados ou treina um novo e o salva."""
+    prophet = load_prophet()
+    model_path = PROPHET_CACHE_DIR / f"{indicator}_{data_hash}.json"
+    if model_path.exists():
+        try:
+            return prophet.serialize.model_from_json(model_path.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"Modelo salvo em {model_path} inválido, treinando novamente: {e}")
+    model = prophet.Prophet(**PROPHET_PARAMS)
+    model.fit(_df_prophet)
+    try:
+        save_prophet_model(prophet, model, indicator, model_path)
+    except OSError as e:
+        print(f"Não foi possível salvar o modelo em {model_path}: {e}") # A previsão segue com o modelo em memória
+    return model
+
+def save_prophet_model(prophet, model, indicator, model_path):
+    """Grava o modelo de forma atômica e remove os modelos antigos do mesmo indicador e temporários abandonados."""
+    PROPHET_CACHE_DIR.mkdir(exist_ok=True)
+    # Escreve em um arquivo temporário no mesmo diretório e o move para o lugar: um processo
+    # interrompido no meio da escrita deixa no máximo um .tmp (varrido abaixo), nunca um .json truncado
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=PROPHET_CACHE_DIR, suffix=".tmp", delete=False) as tmp_file:
+        tmp_path = Path(tmp_file.name)
+        try:
+            tmp_file.write(prophet.serialize.model_to_json(model))
+        except Exception:
+            tmp_file.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+    os.replace(tmp_path, model_path)
+    # O hash dos dados muda a cada carga diária; só o modelo mais recente de cada indicador é mantido
+    for old_path in PROPHET_CACHE_DIR.glob(f"{indicator}_*.json"):
+        if old_path != model_path:
+            old_path.unlink(missing_ok=True)
+    # Temporários recentes podem ser de uma gravação em andamento em outra sessão; só os antigos são removidos
+    for tmp_leftover in PROPHET_CACHE_DIR.glob("*.tmp"):
+        try:
+            if time.time() - tmp_leftover.stat().st_mtime > PROPHET_STALE_TMP_SECONDS:
+                tmp_leftover.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass # Já removido ou renomeado por outra sessão
+
+# O gráfico só muda se o modelo (dados) ou o horizonte mudarem; o hash dos dados muda a cada carga diária,
+# então o cache expira junto com os dados e guarda poucas combinações de indicador e horizonte
+@st.cache_data(ttl=3600, max_entries=15, show_spinner=False)
+def build_components_figure(indicator, data_hash, forecast_periods, _model, _forecast):
+    """Monta o gráfico de componentes da previsão, com os eixos de todos os subplots traduzidos."""
+    # Removido xlabel e ylabel para compatibilidade, conforme investigações anteriores
+    fig_components = load_prophet().plot.plot_components_plotly(_model, _forecast)
+    fig_components.update_xaxes(title_text="Data")
+    fig_components.update_yaxes(title_text="Valor")
+    return fig_components
 
 # --- Streamlit App Layout --- 
 st.set_page_config(page_title="Projeto final de BI - Termômetro da economia", layout="wide")
 
 # Banner no topo
-st.image("assets/banner.png", width=600) 
+st.image(load_asset("assets/banner.png"), width=600) 
 
 st.title("🇧🇷 Projeto Final de BI - Termômetro da Economia Brasileira")
 st.markdown("Dashboard interativo com indicadores econômicos do Brasil.")
 st.caption(f"Dashboard carregado em: {get_current_brasilia_time()} (Horário de Brasília). Dados atualizados conforme fontes originais.")
 
 # --- Fetch Data --- 
-query_selic = "SELECT data_referencia, taxa_selic_percentual AS selic FROM public.stg_selic ORDER BY data_referencia ASC;"
-query_ipca = "SELECT data_referencia, indice_ipca AS ipca FROM public.stg_ipca ORDER BY data_referencia ASC;"
-query_cambio = "SELECT data_referencia, cambio_ptax_venda_brl_usd AS cambio FROM public.stg_cambio_ptax_venda ORDER BY data_referencia ASC;"
-query_desemprego = "SELECT data_referencia, taxa_desemprego_percentual AS desemprego FROM public.stg_desemprego ORDER BY data_referencia ASC;"
-query_pib = "SELECT data_referencia, pib_valor_corrente_brl_milhoes AS pib FROM public.stg_pib_trimestral ORDER BY data_referencia ASC;" 
-
-df_selic_orig = fetch_data(query_selic)
-df_ipca_orig = fetch_data(query_ipca)
-df_cambio_orig = fetch_data(query_cambio)
-df_desemprego_orig = fetch_data(query_desemprego)
-df_pib_orig = fetch_data(query_pib) 
+query_selic = "SELECT data_referencia, taxa_selic_percentual AS selic FROM public.stg_selic"
+query_ipca = "SELECT data_referencia, indice_ipca AS ipca FROM public.stg_ipca"
+query_cambio = "SELECT data_referencia, cambio_ptax_venda_brl_usd AS cambio FROM public.stg_cambio_ptax_venda"
+query_desemprego = "SELECT data_referencia, taxa_desemprego_percentual AS desemprego FROM public.stg_desemprego"
+query_pib = "SELECT data_referencia, pib_valor_corrente_brl_milhoes AS pib FROM public.stg_pib_trimestral" 
+
+QUERIES = {
+    "selic": query_selic,
+    "ipca": query_ipca,
+    "cambio": query_cambio,
+    "desemprego": query_desemprego,
+    "pib": query_pib
+}
+# Variações das queries base: anos disponíveis (para os filtros), período filtrado (para os gráficos)
+# e histórico completo (para a previsão). Os últimos valores vêm de stg_latest_indicators.
+QUERIES_YEARS = {name: f"SELECT DISTINCT EXTRACT(YEAR FROM data_referencia)::int AS ano FROM ({query}) AS q" for name, query in QUERIES.items()}
+QUERIES_BY_YEARS = {name: f"{query} WHERE EXTRACT(YEAR FROM data_referencia) = ANY(%s) ORDER BY data_referencia ASC" for name, query in QUERIES.items()}
+QUERIES_FULL = {name: f"{query} ORDER BY data_referencia ASC" for name, query in QUERIES.items()}
+
+years_data = fetch_all(QUERIES_YEARS)
+
+df_latest = fetch_or_report(fetch_latest_indicators)
+latest_values = df_latest.set_index("indicador") if not df_latest.empty else pd.DataFrame()
 
 # --- Sidebar Filters --- 
 st.sidebar.header("Filtros de Período (Visualização Histórica)")
@@ -117,14 +305,10 @@ if st.sidebar.button("🔄 Atualizar Dados do Dashboard", key="refresh_data_butt
     st.success("Cache de dados limpo! O dashboard será recarregado com os dados mais recentes do banco.")
     st.rerun()
 
-all_years = set()
-if not df_selic_orig.empty and "ano" in df_selic_orig.columns: all_years.update(df_selic_orig["ano"].unique())
-if not df_ipca_orig.empty and "ano" in df_ipca_orig.columns: all_years.update(df_ipca_orig["ano"].unique())
-if not df_cambio_orig.empty and "ano" in df_cambio_orig.columns: all_years.update(df_cambio_orig["ano"].unique())
-if not df_desemprego_orig.empty and "ano" in df_desemprego_orig.columns: all_years.update(df_desemprego_orig["ano"].unique())
-if not df_pib_orig.empty and "ano" in df_pib_orig.columns: all_years.update(df_pib_orig["ano"].unique())
-
-sorted_years = sorted([int(y) for y in filter(lambda x: not pd.isna(x), all_years)], reverse=True)
+# União dos anos de todos os indicadores, deduplicada e ordenada pelo numpy (ordem decrescente)
+year_arrays = [df["ano"].to_numpy(dtype=float) for df in years_data.values() if not df.empty and "ano" in df.columns]
+all_years = np.unique(np.concatenate(year_arrays)) if year_arrays else np.array([])
+sorted_years = all_years[~np.isnan(all_years)].astype(int)[::-1].tolist()
 
 filter_type = st.sidebar.radio(
     "Tipo de Filtro (Histórico):", 
@@ -164,69 +348,67 @@ elif filter_type == "Biênio":
     else:
         selected_years_final = sorted_years
 
-# --- Filter Data Based on Selection --- 
-def filter_df_by_years(df, years):
-    if df.empty or "ano" not in df.columns:
-        return df
-    df_copy = df.copy()
-    df_copy["ano"] = pd.to_numeric(df_copy["ano"], errors="coerce")
-    return df_copy[df_copy["ano"].isin(years)].sort_values(by='data_referencia')
+# --- Filter Data Based on Selection (no próprio banco) --- 
+if selected_years_final:
+    filtered_data = fetch_all(QUERIES_BY_YEARS, (sorted(selected_years_final),))
+else:
+    filtered_data = {name: pd.DataFrame() for name in QUERIES}
 
-df_selic_filtered = filter_df_by_years(df_selic_orig, selected_years_final)
-df_ipca_filtered = filter_df_by_years(df_ipca_orig, selected_years_final)
-df_cambio_filtered = filter_df_by_years(df_cambio_orig, selected_years_final)
-df_desemprego_filtered = filter_df_by_years(df_desemprego_orig, selected_years_final)
-df_pib_filtered = filter_df_by_years(df_pib_orig, selected_years_final) 
+df_selic_filtered = filtered_data["selic"]
+df_ipca_filtered = filtered_data["ipca"]
+df_cambio_filtered = filtered_data["cambio"]
+df_desemprego_filtered = filtered_data["desemprego"]
+df_pib_filtered = filtered_data["pib"] 
 
 # --- Display Key Metrics --- 
 col_header_icon_metricas, col_header_title_metricas = st.columns([0.05, 0.95])
 with col_header_icon_metricas:
-    st.image("assets/meta.png", width=40)
+    st.image(load_asset("assets/meta.png"), width=40)
 with col_header_title_metricas:
     st.header("Últimos Valores Registrados")
 
 col_m1, col_m2, col_m3, col_m4, col_m5 = st.columns(5) 
 
 with col_m1:
-    st.image("assets/selic.png", width=30)
-    if not df_selic_orig.empty:
-        latest_selic = df_selic_orig.sort_values(by='data_referencia', ascending=False).iloc[0]
-        st.metric(label=f"Selic (% a.a.) - {latest_selic['data_referencia'].strftime('%d/%m/%Y')}", value=f"{latest_selic['selic']:.2f}%")
+    st.image(load_asset("assets/selic.png"), width=30)
+    if "selic" in latest_values.index:
+        latest_selic = latest_values.loc["selic"]
+        st.metric(label=f"Selic (% a.a.) - {latest_selic['data_referencia'].strftime('%d/%m/%Y')}", value=f"{latest_selic['valor']:.2f}%")
     else:
         st.metric(label="Selic (% a.a.)", value="N/D")
 with col_m2:
-    st.image("assets/inflacao.png", width=30)
-    if not df_ipca_orig.empty:
-        latest_ipca = df_ipca_orig.sort_values(by='data_referencia', ascending=False).iloc[0]
-        st.metric(label=f"IPCA (Índice) - {latest_ipca['data_referencia'].strftime('%d/%m/%Y')}", value=f"{latest_ipca['ipca']:.2f}")
+    st.image(load_asset("assets/inflacao.png"), width=30)
+    if "ipca" in latest_values.index:
+        latest_ipca = latest_values.loc["ipca"]
+        st.metric(label=f"IPCA (Índice) - {latest_ipca['data_referencia'].strftime('%d/%m/%Y')}", value=f"{latest_ipca['valor']:.2f}")
     else:
         st.metric(label="IPCA", value="N/D")
 with col_m3:
-    st.image("assets/cambio.png", width=30)
-    if not df_cambio_orig.empty:
-        latest_cambio = df_cambio_orig.sort_values(by='data_referencia', ascending=False).iloc[0]
-        st.metric(label=f"Câmbio (R$/US$) - {latest_cambio['data_referencia'].strftime('%d/%m/%Y')}", value=f"R$ {latest_cambio['cambio']:.2f}")
+    st.image(load_asset("assets/cambio.png"), width=30)
+    if "cambio" in latest_values.index:
+        latest_cambio = latest_values.loc["cambio"]
+        st.metric(label=f"Câmbio (R$/US$) - {latest_cambio['data_referencia'].strftime('%d/%m/%Y')}", value=f"R$ {latest_cambio['valor']:.2f}")
     else:
         st.metric(label="Câmbio (R$/US$)", value="N/D")
 with col_m4:
-    st.image("assets/desemprego.png", width=30)
-    if not df_desemprego_orig.empty:
-        latest_desemprego = df_desemprego_orig.sort_values(by='data_referencia', ascending=False).iloc[0]
-        st.metric(label=f"Desemprego (%) - {latest_desemprego['data_referencia'].strftime('%d/%m/%Y')}", value=f"{latest_desemprego['desemprego']:.1f}%")
+    st.image(load_asset("assets/desemprego.png"), width=30)
+    if "desemprego" in latest_values.index:
+        latest_desemprego = latest_values.loc["desemprego"]
+        st.metric(label=f"Desemprego (%) - {latest_desemprego['data_referencia'].strftime('%d/%m/%Y')}", value=f"{latest_desemprego['valor']:.1f}%")
     else:
         st.metric(label="Desemprego (%)", value="N/D")
 with col_m5: 
-    st.image("assets/pib.png", width=30)
-    if not df_pib_orig.empty:
-        latest_pib = df_pib_orig.sort_values(by='data_referencia', ascending=False).iloc[0]
-        st.metric(label=f"PIB (R$ Bilhões) - {latest_pib['data_referencia'].strftime('%d/%m/%Y')}", value=f"R$ {latest_pib['pib']/1e3:.2f} Bi") 
+    st.image(load_asset("assets/pib.png"), width=30)
+    if "pib" in latest_values.index:
+        latest_pib = latest_values.loc["pib"]
+        st.metric(label=f"PIB (R$ Bilhões) - {latest_pib['data_referencia'].strftime('%d/%m/%Y')}", value=f"R$ {latest_pib['valor']/1e3:.2f} Bi") 
     else:
         st.metric(label="PIB (R$ Milhões)", value="N/D")
 
 # --- Display Charts --- 
 col_header_icon_charts, col_header_title_charts = st.columns([0.05, 0.95])
 with col_header_icon_charts:
-    st.image("assets/mercado-de-acoes.png", width=40)
+    st.image(load_asset("assets/mercado-de-acoes.png"), width=40)
 with col_header_title_charts:
     st.header(f"Visualização Histórica de Indicadores Macroeconômicos ({filter_label})")
 
@@ -236,9 +418,15 @@ def plot_indicator(df, x_col, y_col, title, labels, y_format, col_obj):
     with col_obj:
         st.subheader(title)
         if not df.empty:
-            fig = px.line(df, x=x_col, y=y_col, title=title, labels=labels, markers=True)
-            fig.update_traces(hovertemplate=f"Data: %{{x|%d/%m/%Y}}<br>{labels[y_col]}: %{{y:{y_format}}}")
-            fig.update_layout(hovermode="x unified")
+            df_plot = resample_weekly(df, x_col, y_col) if len(df) > RESAMPLE_THRESHOLD else df
+            # Scattergl renderiza via WebGL, bem mais leve que SVG para séries longas
+            fig = go.Figure(go.Scattergl(
+                x=df_plot[x_col],
+                y=df_plot[y_col],
+                mode="lines+markers" if len(df_plot) <= MARKERS_THRESHOLD else "lines",
+                hovertemplate=f"Data: %{{x|%d/%m/%Y}}<br>{labels[y_col]}: %{{y:{y_format}}}<extra></extra>"
+            ))
+            fig.update_layout(title=title, xaxis_title=labels[x_col], yaxis_title=labels[y_col], hovermode="x unified")
             st.plotly_chart(fig, use_container_width=True)
         else:
             st.warning(f"Não há dados de {title.split('(')[0].strip()} para o período selecionado.")
@@ -252,116 +440,130 @@ plot_indicator(df_pib_filtered, "data_referencia", "pib", "PIB Trimestral (R$ Mi
 # --- Correlation Analysis --- 
 col_header_icon_corr, col_header_title_corr = st.columns([0.05, 0.95])
 with col_header_icon_corr:
-    st.image("assets/dispersao-espalhar.png", width=40)
+    st.image(load_asset("assets/dispersao-espalhar.png"), width=40)
 with col_header_title_corr:
     st.header(f"Análise de Correlação ({filter_label})")
 
 indicator_options_corr = {
-    "Selic (% a.a.)": df_selic_filtered,
-    "IPCA (Índice)": df_ipca_filtered,
-    "Câmbio (R$/US$)": df_cambio_filtered,
-    "Desemprego (%)": df_desemprego_filtered,
-    "PIB (R$ Milhões)": df_pib_filtered 
+    "Selic (% a.a.)": "selic",
+    "IPCA (Índice)": "ipca",
+    "Câmbio (R$/US$)": "cambio",
+    "Desemprego (%)": "desemprego",
+    "PIB (R$ Milhões)": "pib" 
 }
-valid_indicators_corr = {name: df for name, df in indicator_options_corr.items() if not df.empty}
-
-if len(valid_indicators_corr) >= 2:
-    col_corr1, col_corr2 = st.columns(2)
-    with col_corr1:
-        indicator1_name = st.selectbox("Selecione o primeiro indicador para correlação:", list(valid_indicators_corr.keys()), index=0, key="corr_ind1")
-    with col_corr2:
-        available_options_y = [name for name in valid_indicators_corr.keys() if name != indicator1_name]
-        if not available_options_y:
-             st.warning("Selecione pelo menos dois indicadores com dados disponíveis para correlação.")
-        else:
-            indicator2_name = st.selectbox("Selecione o segundo indicador para correlação:", available_options_y, index=0, key="corr_ind2")
-            df1 = valid_indicators_corr[indicator1_name].set_index('data_referencia')
-            df2 = valid_indicators_corr[indicator2_name].set_index('data_referencia')
-            df_merged = pd.merge(df1, df2, left_index=True, right_index=True, how="inner")
-            if not df_merged.empty and len(df_merged) > 1:
-                col_name1 = df_merged.columns[0]
-                col_name2 = df_merged.columns[1]
-                correlation = df_merged[col_name1].corr(df_merged[col_name2])
-                st.subheader(f"Correlação entre {indicator1_name} e {indicator2_name}")
-                st.metric(label="Coeficiente de Correlação (Pearson)", value=f"{correlation:.3f}")
-                fig_corr = px.scatter(df_merged, x=col_name1, y=col_name2, title=f"{indicator1_name} vs {indicator2_name}", labels={col_name1: indicator1_name, col_name2: indicator2_name}, trendline="ols")
-                st.plotly_chart(fig_corr, use_container_width=True)
-            elif len(df_merged) <= 1:
-                 st.warning(f"Não há dados suficientes em comum entre '{indicator1_name}' e '{indicator2_name}' no período selecionado para calcular a correlação.")
+df_corr_all, corr_matrix = build_correlation_data(filtered_data) # Fora do fragmento: trocar os indicadores não recalcula a matriz
+valid_indicators_corr = {name: col for name, col in indicator_options_corr.items() if col in df_corr_all.columns}
+
+@st.fragment # Trocar os indicadores reexecuta só este bloco, não o script inteiro
+def correlation_block(valid_indicators_corr, df_corr_all, corr_matrix):
+    """Seletores, métrica e gráfico de dispersão da análise de correlação."""
+    if len(valid_indicators_corr) >= 2:
+        col_corr1, col_corr2 = st.columns(2)
+        with col_corr1:
+            indicator1_name = st.selectbox("Selecione o primeiro indicador para correlação:", list(valid_indicators_corr.keys()), index=0, key="corr_ind1")
+        with col_corr2:
+            available_options_y = [name for name in valid_indicators_corr.keys() if name != indicator1_name]
+            if not available_options_y:
+                 st.warning("Selecione pelo menos dois indicadores com dados disponíveis para correlação.")
             else:
-                st.warning(f"Não foi possível encontrar datas em comum entre '{indicator1_name}' e '{indicator2_name}' no período selecionado.")
-else:
-    st.warning("Dados insuficientes para análise de correlação. Verifique os filtros ou a disponibilidade dos dados.")
+                indicator2_name = st.selectbox("Selecione o segundo indicador para correlação:", available_options_y, index=0, key="corr_ind2")
+                col_name1 = valid_indicators_corr[indicator1_name]
+                col_name2 = valid_indicators_corr[indicator2_name]
+                df_merged = df_corr_all[[col_name1, col_name2]].dropna()
+                if len(df_merged) > 1:
+                    correlation = corr_matrix.loc[col_name1, col_name2]
+                    st.subheader(f"Correlação entre {indicator1_name} e {indicator2_name}")
+                    st.metric(label="Coeficiente de Correlação (Pearson)", value=f"{correlation:.3f}")
+                    # Linha de tendência por mínimos quadrados via numpy, sem o trendline="ols" (statsmodels) do plotly express
+                    x_values = df_merged[col_name1].to_numpy(dtype=float)
+                    y_values = df_merged[col_name2].to_numpy(dtype=float)
+                    slope, intercept = np.polyfit(x_values, y_values, 1)
+                    x_trend = np.array([x_values.min(), x_values.max()])
+                    fig_corr = go.Figure([
+                        go.Scattergl(x=x_values, y=y_values, mode="markers", name="Observações"),
+                        go.Scattergl(x=x_trend, y=slope * x_trend + intercept, mode="lines", name="Tendência (MQO)")
+                    ])
+                    fig_corr.update_layout(title=f"{indicator1_name} vs {indicator2_name}", xaxis_title=indicator1_name, yaxis_title=indicator2_name)
+                    st.plotly_chart(fig_corr, use_container_width=True)
+                elif df_merged.empty:
+                    st.warning(f"Não foi possível encontrar datas em comum entre '{indicator1_name}' e '{indicator2_name}' no período selecionado.")
+                else:
+                    st.warning(f"Não há dados suficientes em comum entre '{indicator1_name}' e '{indicator2_name}' no período selecionado para calcular a correlação.")
+    else:
+        st.warning("Dados insuficientes para análise de correlação. Verifique os filtros ou a disponibilidade dos dados.")
+
+correlation_block(valid_indicators_corr, df_corr_all, corr_matrix)
 
 # --- Forecasting Section ---
 col_header_icon_forecast, col_header_title_forecast = st.columns([0.05, 0.95])
 with col_header_icon_forecast:
-    st.image("assets/previsao.png", width=40)
+    st.image(load_asset("assets/previsao.png"), width=40)
 with col_header_title_forecast:
     st.header("Previsão de Indicadores")
 
 indicator_options_forecast = {
-    "Selic": (df_selic_orig, "selic"),
-    "IPCA": (df_ipca_orig, "ipca"),
-    "Câmbio": (df_cambio_orig, "cambio"),
-    "Desemprego": (df_desemprego_orig, "desemprego"),
-    "PIB": (df_pib_orig, "pib")
+    "Selic": "selic",
+    "IPCA": "ipca",
+    "Câmbio": "cambio",
+    "Desemprego": "desemprego",
+    "PIB": "pib"
 }
 
-selected_indicator_forecast_name = st.selectbox(
-    "Selecione o indicador para previsão:",
-    list(indicator_options_forecast.keys()),
-    index=0,
-    key="forecast_indicator"
-)
+@st.fragment # Widgets e botão da previsão reexecutam só este bloco
+def forecast_block(indicator_options_forecast):
+    """Seletores, treino do Prophet e exibição da previsão para o indicador escolhido."""
+    selected_indicator_forecast_name = st.selectbox(
+        "Selecione o indicador para previsão:",
+        list(indicator_options_forecast.keys()),
+        index=0,
+        key="forecast_indicator"
+    )
 
-forecast_periods = st.number_input("Período de previsão (dias):", min_value=30, max_value=730, value=365, step=30, key="forecast_days")
+    forecast_periods = st.number_input("Período de previsão (dias):", min_value=30, max_value=730, value=365, step=30, key="forecast_days")
 
-if st.button("Gerar Previsão", key="generate_forecast_button"):
-    df_to_forecast_orig, y_col_name = indicator_options_forecast[selected_indicator_forecast_name]
+    if st.button("Gerar Previsão", key="generate_forecast_button"):
+        y_col_name = indicator_options_forecast[selected_indicator_forecast_name]
+        df_to_forecast_orig = fetch_or_report(fetch_data, QUERIES_FULL[y_col_name]) # Prophet precisa do histórico completo, não só dos anos filtrados
     
-    if df_to_forecast_orig.empty or not pd.api.types.is_datetime64_any_dtype(df_to_forecast_orig["data_referencia"]):
-        st.error(f"Dados insuficientes ou formato de data inválido para {selected_indicator_forecast_name}.")
-    else:
-        df_prophet = df_to_forecast_orig[["data_referencia", y_col_name]].copy()
-        df_prophet.rename(columns={"data_referencia": "ds", y_col_name: "y"}, inplace=True)
-        df_prophet = df_prophet.dropna(subset=["ds", "y"])
-        df_prophet = df_prophet.sort_values(by="ds")
-
-        if len(df_prophet) < 2:
-            st.error(f"Não há dados suficientes para treinar o modelo de previsão para {selected_indicator_forecast_name} (mínimo 2 pontos).")
+        if df_to_forecast_orig.empty or not pd.api.types.is_datetime64_any_dtype(df_to_forecast_orig["data_referencia"]):
+            st.error(f"Dados insuficientes ou formato de data inválido para {selected_indicator_forecast_name}.")
         else:
-            try:
-                with st.spinner(f"Treinando modelo e gerando previsão para {selected_indicator_forecast_name}..."):
-                    model = Prophet()
-                    model.fit(df_prophet)
-                    future = model.make_future_dataframe(periods=forecast_periods)
-                    forecast = model.predict(future)
-
-                st.subheader(f"Previsão para {selected_indicator_forecast_name}")
-                fig_forecast = plot_plotly(model, forecast)
-                fig_forecast.update_layout(title=f"Previsão de {selected_indicator_forecast_name} para os próximos {forecast_periods} dias", xaxis_title="Data", yaxis_title="Valor")
-                st.plotly_chart(fig_forecast, use_container_width=True)
-
-                st.subheader(f"Componentes da Previsão para {selected_indicator_forecast_name}")
-                # Removido xlabel e ylabel para compatibilidade, conforme investigações anteriores
-                fig_components = plot_components_plotly(model, forecast)
-                # Tentar traduzir os eixos dos subplots
-                for i in range(1, 10): # Tentar para um número razoável de possíveis subplots
-                    try:
-                        fig_components.layout[f"xaxis{i}"].title = "Data"
-                        fig_components.layout[f"yaxis{i}"].title = "Valor"
-                    except Exception:
-                        pass # Ignora se o subplot não existir ou não tiver título configurável
-                st.plotly_chart(fig_components, use_container_width=True)
-
-                st.subheader("Dados da Previsão")
-                st.dataframe(forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].rename(columns={
-                    "ds": "Data", "yhat": "Previsão", "yhat_lower": "Limite Inferior", "yhat_upper": "Limite Superior"
-                }).tail(forecast_periods))
-            except Exception as e:
-                st.error(f"Erro ao gerar previsão para {selected_indicator_forecast_name}: {e}")
-                print(f"Erro ao gerar previsão para {selected_indicator_forecast_name}: {e}")
+            # A seleção de colunas já gera um novo DataFrame e QUERIES_FULL vem ordenada por data
+            df_prophet = df_to_forecast_orig[["data_referencia", y_col_name]].rename(columns={"data_referencia": "ds", y_col_name: "y"})
+            df_prophet = df_prophet.dropna(subset=["ds", "y"])
+            if len(df_prophet) > RESAMPLE_THRESHOLD:
+                df_prophet = resample_weekly(df_prophet, "ds", "y")
+            df_prophet["ds"] = df_prophet["ds"].astype("datetime64[ns]") # O Prophet trabalha com a resolução padrão do pandas
+            df_prophet["y"] = df_prophet["y"].astype("float32")
+
+            if len(df_prophet) < 2:
+                st.error(f"Não há dados suficientes para treinar o modelo de previsão para {selected_indicator_forecast_name} (mínimo 2 pontos).")
+            else:
+                try:
+                    with st.spinner(f"Treinando modelo e gerando previsão para {selected_indicator_forecast_name}..."):
+                        data_hash = hash_training_data(df_prophet)
+                        model = load_or_fit_prophet(y_col_name, data_hash, df_prophet)
+                        future = model.make_future_dataframe(periods=forecast_periods)
+                        forecast = model.predict(future)
+
+                    st.subheader(f"Previsão para {selected_indicator_forecast_name}")
+                    fig_forecast = load_prophet().plot.plot_plotly(model, forecast)
+                    fig_forecast.update_layout(title=f"Previsão de {selected_indicator_forecast_name} para os próximos {forecast_periods} dias", xaxis_title="Data", yaxis_title="Valor")
+                    st.plotly_chart(fig_forecast, use_container_width=True)
+
+                    st.subheader(f"Componentes da Previsão para {selected_indicator_forecast_name}")
+                    fig_components = build_components_figure(y_col_name, data_hash, forecast_periods, model, forecast)
+                    st.plotly_chart(fig_components, use_container_width=True)
+
+                    st.subheader("Dados da Previsão")
+                    st.dataframe(forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].rename(columns={
+                        "ds": "Data", "yhat": "Previsão", "yhat_lower": "Limite Inferior", "yhat_upper": "Limite Superior"
+                    }).tail(forecast_periods))
+                except Exception as e:
+                    st.error(f"Erro ao gerar previsão para {selected_indicator_forecast_name}: {e}")
+                    print(f"Erro ao gerar previsão para {selected_indicator_forecast_name}: {e}")
+
+forecast_block(indicator_options_forecast)
 
 st.sidebar.markdown("---_---")
 st.sidebar.info("Desenvolvido por Márcio Lemos")